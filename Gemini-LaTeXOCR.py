@@ -1,66 +1,69 @@
 import sys
 import os
 import json
-import threading
-import tempfile
+import atexit
+
+# orjson为C实现，解析和序列化比标准库快一个数量级；缺失时回退到json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import re
 import logging
 import io
 import warnings
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
-    QTextEdit, QComboBox, QFileDialog, QWidget, QScrollArea, QMenu, QMessageBox, QCheckBox
+    QTextEdit, QComboBox, QFileDialog, QWidget, QMenu, QMessageBox, QCheckBox
 )
-from PyQt6.QtCore import QTimer, QMetaObject, Qt, pyqtSignal, pyqtSlot, QObject
+from PyQt6.QtCore import QTimer, QMetaObject, Qt, pyqtSignal, pyqtSlot, QObject, QRunnable, QThreadPool
 from PyQt6.QtGui import QImage, QIcon, QAction
 from PIL import Image
-import base64
+import numpy as np
 from google import genai
+from google.genai import types
 
 # 重定向标准错误输出，捕获"共享内存读取失败"等警告
 class StderrRedirector:
     def __init__(self, logger):
         self.logger = logger
         self.original_stderr = sys.stderr
-        self.buffer = ""
-        
+        self.buffer = []
+
     def write(self, text):
         # 写入原始stderr，保持控制台输出
         self.original_stderr.write(text)
-        
+
         # 过滤掉"SharedMemory read faild"消息，不记录到日志
         if "SharedMemory read faild" in text:
             return
-            
-        # 累积文本直到遇到换行符
-        self.buffer += text
+
+        # 以片段列表累积文本，避免长回溯时反复拼接字符串
+        self.buffer.append(text)
         if '\n' in text:
-            lines = self.buffer.split('\n')
+            lines = "".join(self.buffer).split('\n')
             for line in lines[:-1]:  # 处理除最后一行外的所有行
                 if line.strip():  # 忽略空行
                     self.logger.warning(f"控制台错误: {line}")
-            self.buffer = lines[-1]  # 保留最后一行（可能不完整）
-    
+            self.buffer = [lines[-1]] if lines[-1] else []  # 保留最后一行（可能不完整）
+
     def flush(self):
         self.original_stderr.flush()
-        
-    def __del__(self):
-        # 恢复原始stderr
-        sys.stderr = self.original_stderr
 
 # 初始化日志模块
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ImageRecognitionApp")
 
-# 重定向stderr
+# 重定向stderr，退出时恢复（不依赖解释器关闭阶段的GC时机）
 stderr_redirector = StderrRedirector(logger)
 sys.stderr = stderr_redirector
+atexit.register(lambda: setattr(sys, 'stderr', stderr_redirector.original_stderr))
 
 # 忽略PIL的特定警告
 warnings.filterwarnings("ignore", category=UserWarning, module="PIL")
 
 # 压缩图像文件
-def compress_image(image, output_path=None, max_size=(800, 600), quality=95):
+def compress_image(image, output_path=None, max_size=(1024, 1024), quality=95):
     """
     压缩图像文件。
     :param image: 输入图像(PIL Image对象)或图像路径
@@ -75,9 +78,16 @@ def compress_image(image, output_path=None, max_size=(800, 600), quality=95):
             img = Image.open(image)
         else:
             img = image
-            
-        # 调整图像大小
-        img.thumbnail(max_size)
+
+        # 尺寸已在范围内时直接返回，跳过整幅图像的重采样和拷贝
+        if img.width <= max_size[0] and img.height <= max_size[1]:
+            if output_path:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                img.save(output_path, format="JPEG", quality=quality)
+            return img
+
+        # 调整图像大小：BILINEAR对OCR输入足够；reducing_gap让Pillow先整数倍快速缩小再重采样
+        img.thumbnail(max_size, resample=Image.Resampling.BILINEAR, reducing_gap=2.0)
         
         # 如果指定了输出路径，则保存图像
         if output_path:
@@ -89,105 +99,54 @@ def compress_image(image, output_path=None, max_size=(800, 600), quality=95):
         logger.error(f"压缩图像失败: {e}")
         raise
 
-# 将图像编码为 Base64 格式
-def encode_image_to_base64(image):
+# 将图像编码为 JPEG 字节串
+def encode_image_to_jpeg(image):
     """
-    将图像编码为 Base64 格式。
+    将图像编码为 JPEG 字节串，直接交给SDK发送，无需Base64。
     :param image: PIL Image对象或图像文件路径
-    :return: Base64 编码后的字符串
+    :return: JPEG 编码后的 bytes
     """
     try:
         if isinstance(image, str):
             # 如果是文件路径
             with open(image, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+                jpeg_bytes = image_file.read()
         else:
             # 如果是PIL Image对象
             buffer = io.BytesIO()
-            image.save(buffer, format="JPEG")
-            base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-            
-        logger.info(f"Base64 编码长度: {len(base64_image)}")
-        return base64_image
+            # 质量85加4:2:0色度降采样对OCR输入足够，上传体积比默认参数小一半以上
+            image.save(buffer, format="JPEG", quality=85, optimize=False,
+                       subsampling=2, progressive=False)
+            jpeg_bytes = buffer.getvalue()
+
+        logger.info(f"JPEG 编码长度: {len(jpeg_bytes)}")
+        return jpeg_bytes
     except Exception as e:
-        logger.error(f"Base64编码失败: {e}")
+        logger.error(f"JPEG编码失败: {e}")
         raise
 
-# 将 QImage 转换为 PIL Image
-def qimage_to_pil(qimage):
+# 将 QImage 直接转换为 PIL Image（纯内存操作）
+def qimage_to_pil_direct(qimage):
     """
-    将 QImage 转换为 PIL Image 对象，使用更可靠的方法。
+    通过内存缓冲区直接将 QImage 转换为 PIL Image，不经过磁盘和PNG编解码。
     :param qimage: QImage 对象
-    :return: PIL Image 对象
+    :return: PIL Image 对象（RGB格式）
     """
-    try:
-        # 首先尝试将QImage保存到临时缓冲区
-        buffer = io.BytesIO()
-        qimage.save(buffer, "PNG")
-        buffer.seek(0)
-        
-        # 从缓冲区加载PIL图像
-        pil_image = Image.open(buffer)
-        pil_image = pil_image.convert("RGB")  # 确保图像格式一致
-        return pil_image
-    except Exception as e:
-        logger.error(f"QImage转换为PIL Image失败(方法1): {e}")
-        
-        try:
-            # 备用方法：如果第一种方法失败，尝试使用QImage的bits直接转换
-            buffer = QImage(qimage)
-            
-            # 确保图像不为空
-            if buffer.isNull():
-                raise ValueError("QImage为空")
-                
-            # 获取图像格式和尺寸
-            width, height = buffer.width(), buffer.height()
-            if width == 0 or height == 0:
-                raise ValueError(f"图像尺寸无效: {width}x{height}")
-                
-            # 转换为RGB格式
-            if buffer.format() != QImage.Format.Format_RGB32 and buffer.format() != QImage.Format.Format_ARGB32:
-                buffer = buffer.convertToFormat(QImage.Format.Format_RGB32)
-            
-            # 获取图像数据
-            ptr = buffer.bits()
-            if ptr is None:
-                raise ValueError("无法获取图像数据")
-                
-            buffer_size = buffer.bytesPerLine() * height
-            arr = bytes(ptr)[:buffer_size]
-            
-            # 创建PIL Image
-            if buffer.format() == QImage.Format.Format_ARGB32:
-                img = Image.frombytes("RGBA", (width, height), arr, "raw", "BGRA")
-            else:
-                img = Image.frombytes("RGB", (width, height), arr, "raw", "BGR")
-                
-            return img
-        except Exception as e:
-            logger.error(f"QImage转换为PIL Image失败(方法2): {e}")
-            
-            # 最后的备用方法：保存到临时文件
-            try:
-                temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                temp_file_path = temp_file.name
-                temp_file.close()
-                
-                success = qimage.save(temp_file_path, "PNG")
-                if not success:
-                    raise ValueError("保存QImage到临时文件失败")
-                    
-                img = Image.open(temp_file_path)
-                img = img.convert("RGB")  # 确保图像格式一致
-                
-                # 读取后立即删除临时文件
-                os.unlink(temp_file_path)
-                
-                return img
-            except Exception as nested_e:
-                logger.error(f"QImage转换为PIL Image失败(所有方法): {nested_e}")
-                raise ValueError(f"无法转换图像: {e}, {nested_e}")
+    if qimage.isNull():
+        raise ValueError("QImage为空")
+
+    # 统一转换为RGB888格式，保证像素布局可预期
+    img = qimage.convertToFormat(QImage.Format.Format_RGB888)
+    ptr = img.constBits()
+    if ptr is None:
+        raise ValueError("无法获取图像数据")
+    ptr.setsize(img.sizeInBytes())
+
+    # bytesPerLine作为stride传入，处理行对齐填充
+    return Image.frombuffer(
+        "RGB", (img.width(), img.height()), bytes(ptr),
+        "raw", "RGB", img.bytesPerLine(), 1
+    )
 
 # 创建一个自定义日志处理器，将日志输出到 GUI
 class QTextEditLogger(logging.Handler):
@@ -197,10 +156,30 @@ class QTextEditLogger(logging.Handler):
         self.setLevel(logging.INFO)
         self.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
+        # 批量缓冲日志，最多每100ms刷新一次，避免每条日志都触发重排版
+        self._pending = []
+        self._flush_timer = QTimer()
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(100)
+        self._flush_timer.timeout.connect(self._flush)
+
     def emit(self, record):
         msg = self.format(record)
-        # 在PyQt6中调用append方法
-        self.text_edit.append(msg)
+        with self.lock:
+            self._pending.append(msg)
+            already_scheduled = self._flush_timer.isActive()
+        if not already_scheduled:
+            # emit可能在工作线程中被调用，通过队列连接在主线程启动定时器
+            QMetaObject.invokeMethod(self._flush_timer, "start",
+                                     Qt.ConnectionType.QueuedConnection)
+
+    def _flush(self):
+        with self.lock:
+            pending = self._pending
+            self._pending = []
+        if pending:
+            # 合并为一次append，只触发一次布局和滚动
+            self.text_edit.append("\n".join(pending))
 
 # 工作线程信号类
 class WorkerSignals(QObject):
@@ -210,6 +189,15 @@ class WorkerSignals(QObject):
     finished = pyqtSignal()
     progress = pyqtSignal(str)
 
+# OCR任务的可运行对象，交由线程池复用的工作线程执行
+class OcrRunnable(QRunnable):
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+
+    def run(self):
+        self.fn()
+
 # 主窗口类
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -217,9 +205,11 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("图像内容识别工具")
         self.setGeometry(100, 100, 800, 600)
         self.last_clipboard_image_hash = None
+        self.last_clipboard_image_cachekey = None  # QImage缓存键，用于快速跳过未变化的剪贴板
         self.is_clipboard_monitoring_enabled = True  # 剪贴板监控开关
         self.last_clipboard_image = None  # 存储上一次的剪贴板图像
         self.processing_image = False  # 图像处理状态标志
+        self.clipboard_changed_while_processing = False  # 处理期间是否有剪贴板变化待补查
         
         # 创建信号对象
         self.worker_signals = WorkerSignals()
@@ -228,6 +218,10 @@ class MainWindow(QMainWindow):
         self.worker_signals.progress.connect(self.update_result)
         self.worker_signals.finished.connect(self.processing_finished)
 
+        # OCR任务线程池，复用工作线程并限制并发
+        self.thread_pool = QThreadPool.globalInstance()
+        self.thread_pool.setMaxThreadCount(2)
+
         # 确保临时目录存在
         os.makedirs("temp", exist_ok=True)
 
@@ -280,23 +274,17 @@ class MainWindow(QMainWindow):
         
         main_layout.addLayout(button_layout)
 
-        # 结果显示区域
+        # 结果显示区域（QTextEdit自带滚动条，无需再套QScrollArea）
         self.result_text = QTextEdit()
         self.result_text.setReadOnly(False)
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setWidget(self.result_text)
-        main_layout.addWidget(scroll_area)
+        main_layout.addWidget(self.result_text)
 
         # 日志输出区域
         log_label = QLabel("日志输出")
         main_layout.addWidget(log_label)
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
-        log_scroll_area = QScrollArea()
-        log_scroll_area.setWidgetResizable(True)
-        log_scroll_area.setWidget(self.log_text)
-        main_layout.addWidget(log_scroll_area)
+        main_layout.addWidget(self.log_text)
 
         # 设置按钮
         settings_icon_path = "resources/gear.png"
@@ -314,10 +302,8 @@ class MainWindow(QMainWindow):
         log_handler = QTextEditLogger(self.log_text)
         logger.addHandler(log_handler)
 
-        # 启动剪贴板监控
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.check_clipboard_for_image)
-        self.timer.start(2000)
+        # 启动剪贴板监控：事件驱动，只在剪贴板真正变化时触发
+        QApplication.clipboard().dataChanged.connect(self.check_clipboard_for_image)
 
         # 初始化剪贴板状态
         self.initialize_clipboard_state()
@@ -331,25 +317,36 @@ class MainWindow(QMainWindow):
     def processing_finished(self):
         """图像处理完成"""
         self.processing_image = False
+        # 处理期间若有剪贴板变化被挡下，补查一次
+        if self.clipboard_changed_while_processing:
+            self.clipboard_changed_while_processing = False
+            QTimer.singleShot(0, self.check_clipboard_for_image)
 
     def load_settings(self):
         """加载配置文件"""
         self.api_key = ""
         if os.path.exists(self.settings_file):
             try:
-                with open(self.settings_file, "r") as file:
-                    settings = json.load(file)
-                    self.api_key = settings.get("api_key", "")
+                with open(self.settings_file, "rb") as file:
+                    data = file.read()
+                settings = orjson.loads(data) if orjson is not None else json.loads(data)
+                self.api_key = settings.get("api_key", "")
             except Exception as e:
                 logger.error(f"加载配置文件失败: {e}")
 
     def save_settings(self):
-        """保存配置文件"""
+        """保存配置文件（先写临时文件再原子替换，避免写一半的配置）"""
         settings = {"api_key": self.api_key}
         os.makedirs(os.path.dirname(self.settings_file), exist_ok=True)
         try:
-            with open(self.settings_file, "w") as file:
-                json.dump(settings, file, indent=4)
+            if orjson is not None:
+                data = orjson.dumps(settings, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(settings, indent=4).encode("utf-8")
+            tmp_path = self.settings_file + ".tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, self.settings_file)
             logger.info("配置文件已保存")
         except Exception as e:
             logger.error(f"保存配置文件失败: {e}")
@@ -389,12 +386,15 @@ class MainWindow(QMainWindow):
 
     def toggle_clipboard_monitoring(self, enable):
         """切换剪贴板监控状态"""
+        if enable == self.is_clipboard_monitoring_enabled:
+            return
         self.is_clipboard_monitoring_enabled = enable
-        if self.is_clipboard_monitoring_enabled:
-            self.timer.start(2000)
+        clipboard = QApplication.clipboard()
+        if enable:
+            clipboard.dataChanged.connect(self.check_clipboard_for_image)
             logger.info("剪贴板监控已启用")
         else:
-            self.timer.stop()
+            clipboard.dataChanged.disconnect(self.check_clipboard_for_image)
             logger.info("剪贴板监控已禁用")
 
     def initialize_clipboard_state(self):
@@ -404,21 +404,12 @@ class MainWindow(QMainWindow):
             image = clipboard.image()
             if not image.isNull():
                 try:
-                    # 保存到临时文件然后用PIL打开，避免共享内存问题
-                    temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                    temp_file_path = temp_file.name
-                    temp_file.close()
-                    
-                    if image.save(temp_file_path, "PNG"):
-                        try:
-                            pil_image = Image.open(temp_file_path).convert("RGB")
-                            self.last_clipboard_image_hash = self.calculate_image_hash(pil_image)
-                            self.last_clipboard_image = pil_image
-                            logger.info("已初始化剪贴板图像状态")
-                        finally:
-                            # 确保删除临时文件
-                            if os.path.exists(temp_file_path):
-                                os.unlink(temp_file_path)
+                    # 直接在内存中转换为PIL图像，避免临时文件读写
+                    pil_image = qimage_to_pil_direct(image)
+                    self.last_clipboard_image_cachekey = image.cacheKey()
+                    self.last_clipboard_image_hash = self.calculate_image_hash(pil_image)
+                    self.last_clipboard_image = pil_image
+                    logger.info("已初始化剪贴板图像状态")
                 except Exception as e:
                     logger.error(f"初始化剪贴板状态失败: {e}")
         else:
@@ -470,52 +461,49 @@ class MainWindow(QMainWindow):
         self.initialize_clipboard_state()
 
     def check_clipboard_for_image(self):
-        """检查剪贴板内容并处理新图像，优化版本无需保存未变化的图像到临时文件"""
-        if not self.is_clipboard_monitoring_enabled or self.processing_image:
+        """检查剪贴板内容并处理新图像，全程在内存中完成，不使用临时文件"""
+        if not self.is_clipboard_monitoring_enabled:
             return
-            
+        if self.processing_image:
+            # dataChanged不会为同一内容重发，记录下来等处理完成后补查
+            self.clipboard_changed_while_processing = True
+            return
+
         try:
             clipboard = QApplication.clipboard()
             if clipboard.mimeData().hasImage():
                 image = clipboard.image()
                 if not image.isNull():
                     try:
-                        # 尝试将剪贴板图像保存到临时文件，然后用PIL打开
-                        temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                        temp_file_path = temp_file.name
-                        temp_file.close()
-                        
-                        if image.save(temp_file_path, "PNG"):
-                            try:
-                                # 使用PIL打开图像
-                                pil_image = Image.open(temp_file_path).convert("RGB")
-                                
-                                # 计算图像哈希
-                                image_hash = self.calculate_image_hash(pil_image)
-                                
-                                if image_hash != self.last_clipboard_image_hash:
-                                    # 图像发生变化，更新哈希值和保存的图像
-                                    logger.info("检测到新的剪贴板图像")
-                                    self.last_clipboard_image_hash = image_hash
-                                    self.last_clipboard_image = pil_image
-                                    
-                                    # 检查API Key
-                                    api_key = self.api_key_entry.text()
-                                    if not api_key:
-                                        logger.warning("未设置API Key，跳过处理剪贴板图像")
-                                        os.unlink(temp_file_path)  # 删除临时文件
-                                        return
-                                        
-                                    model = self.model_combobox.currentText()
-                                    
-                                    # 处理图像
-                                    self.process_pil_image(pil_image, api_key, model)
-                                else:
-                                    logger.info("剪贴板图像未发生变化，跳过处理")
-                            finally:
-                                # 确保删除临时文件
-                                if os.path.exists(temp_file_path):
-                                    os.unlink(temp_file_path)
+                        # 先比较QImage缓存键，剪贴板未变化时只需一次整数比较
+                        if image.cacheKey() == self.last_clipboard_image_cachekey:
+                            return
+                        self.last_clipboard_image_cachekey = image.cacheKey()
+
+                        # 直接在内存中转换为PIL图像，避免临时文件读写
+                        pil_image = qimage_to_pil_direct(image)
+
+                        # 计算图像哈希
+                        image_hash = self.calculate_image_hash(pil_image)
+
+                        if image_hash != self.last_clipboard_image_hash:
+                            # 图像发生变化，更新哈希值和保存的图像
+                            logger.info("检测到新的剪贴板图像")
+                            self.last_clipboard_image_hash = image_hash
+                            self.last_clipboard_image = pil_image
+
+                            # 检查API Key
+                            api_key = self.api_key_entry.text()
+                            if not api_key:
+                                logger.warning("未设置API Key，跳过处理剪贴板图像")
+                                return
+
+                            model = self.model_combobox.currentText()
+
+                            # 处理图像
+                            self.process_pil_image(pil_image, api_key, model)
+                        else:
+                            logger.info("剪贴板图像未发生变化，跳过处理")
                     except Exception as e:
                         logger.error(f"处理剪贴板图像失败: {e}")
                 else:
@@ -526,20 +514,19 @@ class MainWindow(QMainWindow):
             logger.error(f"检查剪贴板失败: {e}")
     
     def calculate_image_hash(self, pil_image):
-        """计算图像的哈希值，更可靠的方法"""
+        """计算图像的感知哈希（dHash），对同一图像的重新编码也能保持稳定"""
         try:
-            # 缩小图像以加快哈希计算
-            small_image = pil_image.copy()
-            small_image.thumbnail((100, 100))
-            
-            # 转换为灰度图像
-            if small_image.mode != 'L':
-                small_image = small_image.convert('L')
-                
-            # 计算图像数据的哈希值
-            import hashlib
-            image_data = small_image.tobytes()
-            return hashlib.md5(image_data).hexdigest()
+            # 先转灰度，再用reduce做k倍盒式均值缩小（C实现，每个源像素都参与均值，
+            # 避免点采样漏掉比k还细的内容）
+            gray_image = pil_image.convert("L")
+            k = max(1, min(gray_image.size) // 16)
+            if k > 1:
+                gray_image = gray_image.reduce(k)
+            small = np.asarray(gray_image, dtype=np.uint8)
+
+            # 比较相邻像素得到差值哈希
+            bits = (small[:, 1:] > small[:, :-1]).flatten()
+            return np.packbits(bits).tobytes()
         except Exception as e:
             logger.error(f"计算图像哈希失败: {e}")
             # 回退到简单的哈希方法
@@ -576,7 +563,7 @@ class MainWindow(QMainWindow):
                     # 发送完成信号
                     self.worker_signals.finished.emit()
                     
-            threading.Thread(target=task).start()
+            self.thread_pool.start(OcrRunnable(task))
         except Exception as e:
             self.processing_image = False
             logger.error(f"启动图像处理线程失败: {e}")
@@ -609,12 +596,17 @@ class MainWindow(QMainWindow):
                     # 发送完成信号
                     self.worker_signals.finished.emit()
                     
-            threading.Thread(target=task).start()
+            self.thread_pool.start(OcrRunnable(task))
         except Exception as e:
             self.processing_image = False
             logger.error(f"启动图像处理线程失败: {e}")
             self.worker_signals.error.emit(f"发生错误: {e}")
 
+# 模块级预编译的正则，避免每次处理API响应时重复编译
+_FENCE_RE = re.compile(r'^```(?:latex)?\s*|\s*```$', re.MULTILINE)
+_EQUATION_RE = re.compile(r'\\begin\{equation\*\}(.*?)\\end\{equation\*\}', re.DOTALL)
+_ALIGN_RE = re.compile(r'\\begin\{align\*\}(.*?)\\end\{align\*\}', re.DOTALL)
+
 # 处理 LaTeX 输出结果
 def process_latex_output(latex_output):
     """
@@ -626,55 +618,57 @@ def process_latex_output(latex_output):
     """
     try:
         # 去除首尾的多余 Markdown 代码块标记
-        latex_output = latex_output.strip()
-        if latex_output.startswith("```latex"):
-            latex_output = latex_output[8:].strip()
-        elif latex_output.startswith("```"):
-            latex_output = latex_output[3:].strip()
-        if latex_output.endswith("```"):
-            latex_output = latex_output[:-3].strip()
+        latex_output = _FENCE_RE.sub('', latex_output.strip()).strip()
 
         # 将 \\[ 和 \\] 替换为 $$，将 \\( 和 \\) 替换为 $
         latex_output = latex_output.replace(r'\[', '$$').replace(r'\]', '$$')
         latex_output = latex_output.replace(r'\(', '$').replace(r'\)', '$')
-        
-        # 处理 equation* 和 align* 环境
-        
-        # 处理 equation* 环境
-        equation_pattern = re.compile(r'\\begin\{equation\*\}(.*?)\\end\{equation\*\}', re.DOTALL)
-        latex_output = equation_pattern.sub(r'$$ \1 $$', latex_output)
-        
-        # 处理 align* 环境
-        align_pattern = re.compile(r'\\begin\{align\*\}(.*?)\\end\{align\*\}', re.DOTALL)
-        latex_output = align_pattern.sub(r'$$ \1 $$', latex_output)
+
+        # 处理 equation* 和 align* 环境；先做子串判断，常见的无环境输出免去两次正则扫描
+        if r'\begin{equation*}' in latex_output:
+            latex_output = _EQUATION_RE.sub(r'$$ \1 $$', latex_output)
+        if r'\begin{align*}' in latex_output:
+            latex_output = _ALIGN_RE.sub(r'$$ \1 $$', latex_output)
 
         return latex_output
     except Exception as e:
         logger.error(f"处理LaTeX输出失败: {e}")
         return latex_output  # 出错时返回原始输出
 
+# 缓存的Gemini客户端，复用底层HTTPS连接池
+_genai_client = None
+_genai_client_api_key = None
+
+def get_genai_client(api_key):
+    """
+    获取Gemini客户端，API Key未变化时复用同一个实例。
+    :param api_key: API密钥
+    :return: genai.Client 对象
+    """
+    global _genai_client, _genai_client_api_key
+    if _genai_client is None or _genai_client_api_key != api_key:
+        _genai_client = genai.Client(api_key=api_key)
+        _genai_client_api_key = api_key
+    return _genai_client
+
 # 调用 Gemini API 识别图像内容
 def recognize_image_content(image, api_key, model):
     """
     调用Gemini API识别图像内容
-    :param image: PIL Image对象或图像文件路径
+    :param image: PIL Image对象（调用方已压缩）或图像文件路径
     :param api_key: API密钥
     :param model: 模型名称
     :return: 处理后的LaTeX字符串
     """
     try:
-        client = genai.Client(api_key=api_key)
-        
-        # 压缩图像并编码为Base64
+        client = get_genai_client(api_key)
+
         if isinstance(image, str):
-            # 如果是文件路径，先压缩
-            compressed_image = compress_image(image)
-            base64_image = encode_image_to_base64(compressed_image)
+            # 如果是文件路径，先打开并压缩
+            jpeg_bytes = encode_image_to_jpeg(compress_image(image))
         else:
-            # 如果已经是PIL Image对象，直接编码
-            # 确保使用副本，避免修改原始图像
-            compressed_image = compress_image(image.copy())
-            base64_image = encode_image_to_base64(compressed_image)
+            # PIL Image对象由调用方压缩过，直接编码，避免重复thumbnail
+            jpeg_bytes = encode_image_to_jpeg(image)
         
         # 调用API
         response = client.models.generate_content(
@@ -684,7 +678,7 @@ def recognize_image_content(image, api_key, model):
                     "role": "user",
                     "parts": [
                         {"text": "请以LaTeX代码格式输出图像中的所有内容，不需要documentclass声明。请确保微分符号d、虚数单位i和欧拉常数e为正体，使用\\mathrm{}包裹，对于加粗的符号使用\\bm{}包裹，不要使用\\mathbf。请注意分辨行内公式与行间公式，行间公式不要使用有编号的公式环境。对于行列式请使用vmatrix环境，对于矩阵请使用pmatrix环境。"},
-                        {"inline_data": {"mime_type": "image/jpeg", "data": base64_image}}
+                        types.Part.from_bytes(data=jpeg_bytes, mime_type="image/jpeg")
                     ]
                 }
             ]